@@ -2,12 +2,16 @@ from fastapi import (
     APIRouter,
     UploadFile,
     File,
-    BackgroundTasks,
     HTTPException,
     Query,
     Body,
 )
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import os
 import shutil
+from pathlib import Path
+from typing import BinaryIO
 from ..models.schemas import QueryRequest, QueryResponse, UploadResponse
 from ..core.config import UPLOADS_DIR, CHITCHAT_RESPONSES
 from ..core import rag_service
@@ -19,19 +23,60 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-
-@router.post("/upload-csv", response_model=UploadResponse)
-async def upload_csv(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+UPLOAD_COPY_BUFFER_SIZE = 1024 * 1024
+GEMINI_TEST_LOCATION = "us-central1"
+
+_gemini_model = None
+
+
+def _get_gemini_model() -> GenerativeModel:
+    """
+    Initializes Vertex AI and the /gemini-test model on first use. The
+    project id is read from the environment at that point, because
+    load_dotenv() and the app's startup default only set GCP_PROJECT_ID
+    after this module is imported.
+    """
+    global _gemini_model
+    if _gemini_model is None:
+        project_id = os.environ.get("GCP_PROJECT_ID")
+        logger.info(
+            f"🔍 Initializing Gemini with project={project_id}, "
+            f"location={GEMINI_TEST_LOCATION}"
+        )
+        init(project=project_id, location=GEMINI_TEST_LOCATION)
+        _gemini_model = GenerativeModel("gemini-2.0-flash-lite-001")
+    return _gemini_model
+
+
+def _save_upload(source: BinaryIO, destination: Path):
+    """
+    Writes an uploaded file to disk. Uploads that were spooled to a real
+    temporary file are copied kernel-side with sendfile.
+    """
+    with open(destination, "wb") as buffer:
+        if hasattr(os, "sendfile") and getattr(source, "_rolled", False):
+            source.flush()
+            in_fd = source.fileno()
+            size = os.fstat(in_fd).st_size
+            offset = source.tell()
+            while offset < size:
+                sent = os.sendfile(buffer.fileno(), in_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        else:
+            shutil.copyfileobj(source, buffer, UPLOAD_COPY_BUFFER_SIZE)
+
+
+@router.post("/upload-csv", response_model=UploadResponse, status_code=202)
+async def upload_csv(file: UploadFile = File(...)):
     if not file.filename:
         raise HTTPException(status_code=400, detail="The uploaded file has no name.")
 
     file_path = UPLOADS_DIR / file.filename
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await run_in_threadpool(_save_upload, file.file, file_path)
 
-    background_tasks.add_task(
-        rag_service.ingest_data_in_background, csv_path=str(file_path)
-    )
+    rag_service.submit_ingestion(str(file_path))
 
     return UploadResponse(
         filename=file.filename,
@@ -41,11 +86,30 @@ async def upload_csv(background_tasks: BackgroundTasks, file: UploadFile = File(
 
 @router.post("/chat", response_model=QueryResponse)
 async def chat_endpoint(request: QueryRequest, k: int = Query(3, ge=1, le=10)):
-    # 1. Clasificar la intención del usuario primero
-    intent = rag_service.classify_intent(request.question)
+    # 1. Clasificar la intención del usuario primero. Si ninguna palabra clave
+    # coincide, el LLM clasifica mientras los documentos se recuperan en paralelo.
+    # La pregunta se embebe una sola vez, para la recuperación y para la caché
+    # de respuestas.
+    intent = rag_service.match_chitchat_intent(request.question)
+    embedding_task = None
+    retrieval_task = None
+    if intent is None:
+        intent_task = asyncio.create_task(rag_service.classify_intent(request.question))
+        if rag_service.vector_store:
+            embedding_task = asyncio.create_task(
+                rag_service.query_embedder.embed(request.question)
+            )
+            retrieval_task = asyncio.create_task(
+                rag_service.aretrieve_documents(
+                    request.question, k, embedding=embedding_task
+                )
+            )
+        intent = await intent_task
 
     # 2. Manejar intenciones de chitchat
     if intent in CHITCHAT_RESPONSES:
+        rag_service.discard_task(retrieval_task)
+        rag_service.discard_task(embedding_task)
         response_text = CHITCHAT_RESPONSES[intent]["response"]
         return QueryResponse(answer=response_text)
 
@@ -53,14 +117,25 @@ async def chat_endpoint(request: QueryRequest, k: int = Query(3, ge=1, le=10)):
     if not rag_service.vector_store:
         raise HTTPException(status_code=503, detail="The vector database is not ready.")
 
-    rag_response = rag_service.get_rag_answer(
-        session_id=request.session_id, question=request.question, k=k
+    rag_response = await rag_service.get_rag_answer(
+        session_id=request.session_id,
+        question=request.question,
+        k=k,
+        retrieval=retrieval_task,
+        embedding=embedding_task,
     )
     return QueryResponse(
         answer=rag_response["answer"], debug_prompt=rag_response["prompt"]
     )
 
 
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not rag_service.delete_memory_for_session(session_id):
+        raise HTTPException(status_code=404, detail="Session not found.")
+    return {"session_id": session_id, "detail": "Session memory deleted."}
+
+
 @router.get("/status")
 async def get_status():
     # Return the current status of the vector store
@@ -77,14 +152,8 @@ async def get_status():
 @router.post("/gemini-test")
 async def gemini_test(prompt: str = Body(..., embed=True)):
     try:
-        project_id = rag_service.GCP_PROJECT_ID
-        location = "us-central1"  # o probá con us-central1 si da error
-
-        logger.info(f"🔍 Testing Gemini with project={project_id}, location={location}")
-
-        init(project=project_id, location=location)
-        model = GenerativeModel("gemini-2.0-flash-lite-001")
-        response = model.generate_content(prompt)
+        model = _get_gemini_model()
+        response = await model.generate_content_async(prompt)
 
         return {
             "prompt": prompt,
@@ -0,0 +1,72 @@
+import hashlib
+import logging
+from array import array
+
+from langchain_core.embeddings import Embeddings
+from langchain_google_vertexai import VertexAIEmbeddings
+from redis import Redis
+
+logger = logging.getLogger(__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Vertex AI embeddings backed by a Redis cache. Vectors are keyed by model,
+    task type and the SHA-256 of the text, so repeated questions and
+    re-uploaded products are only embedded once.
+    """
+
+    def __init__(
+        self,
+        embeddings: VertexAIEmbeddings,
+        client: Redis,
+        key_prefix: str = "emb:",
+        ttl: int | None = 7 * 24 * 3600,
+    ):
+        self.embeddings = embeddings
+        self.client = client
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+
+    def _key(self, text: str, task_type: str) -> str:
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        return f"{self.key_prefix}{self.embeddings.model_name}:{task_type}:{digest}"
+
+    def embed(self, texts: list[str], embeddings_task_type: str) -> list[list[float]]:
+        """
+        Embeds the texts with the given task type, only sending cache misses
+        to Vertex AI. Redis errors degrade to uncached embedding.
+        """
+        keys = [self._key(text, embeddings_task_type) for text in texts]
+        try:
+            cached = self.client.mget(keys)
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding cache lookup failed: {e}")
+            cached = [None] * len(texts)
+
+        embeddings = [
+            array("f", value).tolist() if value is not None else None
+            for value in cached
+        ]
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not misses:
+            return embeddings
+
+        fresh = self.embeddings.embed(
+            [texts[i] for i in misses], embeddings_task_type=embeddings_task_type
+        )
+        pipeline = self.client.pipeline(transaction=False)
+        for i, embedding in zip(misses, fresh):
+            embeddings[i] = embedding
+            pipeline.set(keys[i], array("f", embedding).tobytes(), ex=self.ttl)
+        try:
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not store embeddings in the cache: {e}")
+        return embeddings
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed(texts, "RETRIEVAL_DOCUMENT")
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed([text], "RETRIEVAL_QUERY")[0]
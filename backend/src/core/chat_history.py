@@ -0,0 +1,53 @@
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+import orjson
+from redis import Redis
+
+
+class RedisChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat message history stored in a Redis list, so every worker and
+    replica serving a session sees the same conversation.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        client: Redis,
+        key_prefix: str = "message_store:",
+        ttl: int | None = None,
+        max_messages: int | None = None,
+    ):
+        self.session_id = session_id
+        self.client = client
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    @property
+    def key(self) -> str:
+        return self.key_prefix + self.session_id
+
+    @property
+    def messages(self) -> list[BaseMessage]:
+        items = self.client.lrange(self.key, 0, -1)
+        return messages_from_dict([orjson.loads(item) for item in items])
+
+    def add_messages(self, messages: list[BaseMessage]) -> None:
+        if not messages:
+            return
+        pipeline = self.client.pipeline()
+        pipeline.rpush(
+            self.key, *[orjson.dumps(message_to_dict(message)) for message in messages]
+        )
+        if self.max_messages:
+            pipeline.ltrim(self.key, -self.max_messages, -1)
+        if self.ttl:
+            pipeline.expire(self.key, self.ttl)
+        pipeline.execute()
+
+    def clear(self) -> None:
+        self.client.delete(self.key)
+
+    def exists(self) -> bool:
+        return bool(self.client.exists(self.key))
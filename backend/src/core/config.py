@@ -12,6 +12,10 @@ UPLOADS_DIR = DATA_DIR / "uploads"
 UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 
 # --- Prompt Configuration ---
+# Keep the invariant instructions first and the per-request parts last:
+# the QA prompt renders as these instructions, then the retrieved {context},
+# then the chat history and finally the question, so consecutive requests
+# share the longest possible prompt prefix for Gemini's prefix caching.
 PROMPT_TEMPLATE = """You are an expert sales assistant and a friendly conversationalist for the Flipkart store.
 Your main goal is to answer product-related questions based on the 'Product context' provided.
 However, you should also use the chat history to answer conversational questions and remember user details like their name.
@@ -20,6 +24,8 @@ However, you should also use the chat history to answer conversational questions
 - If the user asks a conversational question (e.g., "do you remember my name?"), base your answer on the chat history.
 - If the product context is not relevant to the question, ignore it.
 
+---
+
 **Product context for the current question:**
 {context}
 """
@@ -28,15 +34,27 @@ However, you should also use the chat history to answer conversational questions
 CHITCHAT_RESPONSES = {
     "greeting": {
         "response": "Hello! I am your shopping assistant. What product are you looking for today?",
+        "keywords": [
+            "hi",
+            "hello",
+            "hey",
+            "hola",
+            "good morning",
+            "good afternoon",
+            "good evening",
+        ],
     },
     "thanks": {
         "response": "You're welcome! If you need anything else, feel free to ask.",
+        "keywords": ["thanks", "thank you", "thx", "gracias"],
     },
     "goodbye": {
         "response": "Goodbye! Have a great day.",
+        "keywords": ["bye", "goodbye", "see you", "see you later", "adios"],
     },
     "identity": {
-        "response": "I am a shopping assistant powered by Google's AI. I can help you find products from the store catalog."
+        "response": "I am a shopping assistant powered by Google's AI. I can help you find products from the store catalog.",
+        "keywords": ["who are you", "what are you", "what can you do"],
     },
 }
 
@@ -1,9 +1,29 @@
+import asyncio
+import csv
+import io
 import os
+import random
+import re
+import numpy as np
 import pandas as pd
 import logging
 import sys
-import json
+import orjson
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterator
+import pyarrow as pa
+import pyarrow.csv as pcsv
+import pyarrow.parquet as pq
+from collections import Counter
+from cachetools import LRUCache, TTLCache
+from redis import Redis
+from google.api_core.exceptions import ResourceExhausted
 from langchain_core.documents import Document
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
 from langchain_core.prompts import (
     PromptTemplate,
     ChatPromptTemplate,
@@ -12,9 +32,11 @@ from langchain_core.prompts import (
 from langchain.memory import ConversationBufferWindowMemory
 from langchain_google_vertexai import VertexAIEmbeddings, VertexAI
 from langchain_postgres import PGVector
-from sqlalchemy import make_url, create_engine, text
-from sqlalchemy.orm import sessionmaker, joinedload
+from langchain_postgres.vectorstores import DistanceStrategy
+from sqlalchemy import make_url, create_engine, event, func, select, text
+from sqlalchemy.orm import scoped_session, sessionmaker
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable, RunnableLambda
 from langchain.chains import (
     create_history_aware_retriever,
 )
@@ -25,7 +47,11 @@ from ..core.config import (
     PROMPT_TEMPLATE,
     INTENT_CLASSIFICATION_PROMPT,
     CONTEXTUALIZE_QUESTION_PROMPT,
+    CHITCHAT_RESPONSES,
 )
+from ..core.cached_embeddings import CachedEmbeddings
+from ..core.chat_history import RedisChatMessageHistory
+from ..core.embedding_batcher import EmbeddingBatcher
 from ..models.db_models import Product, ProductVariant, Base
 
 # Configure logger
@@ -35,7 +61,8 @@ logger = logging.getLogger(__name__)
 # --- Global Variables ---
 vector_store = None
 embeddings_model = None
-conversation_memory_store = {}
+query_embedder = None
+redis_client = None
 llm = None
 db_engine = None
 SessionLocal = None
@@ -48,6 +75,142 @@ PG_PASSWORD = os.environ.get("DB_PASSWORD")
 PG_PORT = os.environ.get("DB_PORT", "5432")
 PG_DB_NAME = os.environ.get("DB_NAME")
 GCP_PROJECT_ID = os.environ.get("GCP_PROJECT_ID")
+# When set, conversation memory and embeddings are shared through Redis
+# across workers.
+REDIS_URL = os.environ.get("REDIS_URL")
+# Memory for the HNSW index build; keep it within the instance's RAM.
+PG_MAINTENANCE_WORK_MEM = os.environ.get("DB_MAINTENANCE_WORK_MEM", "256MB")
+PG_MAX_PARALLEL_MAINTENANCE_WORKERS = int(
+    os.environ.get("DB_MAX_PARALLEL_MAINTENANCE_WORKERS", "7")
+)
+# Connection pool per process; keep pool size + overflow of the API and
+# ingestion processes below the server's max_connections (about 25 on the
+# db-f1-micro tier).
+PG_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+PG_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "5"))
+# The ingestion process only runs an inserting and an indexing thread.
+PG_INGESTION_POOL_SIZE = 2
+PG_INGESTION_MAX_OVERFLOW = 1
+PG_POOL_RECYCLE_SECONDS = 1800
+
+# --- Conversation Memory ---
+MEMORY_WINDOW_TURNS = 10
+MEMORY_TTL_SECONDS = 3600
+# Sessions idle for longer than the TTL are evicted, as are the least
+# recently used ones once the store is full.
+conversation_memory_store = TTLCache(maxsize=10_000, ttl=MEMORY_TTL_SECONDS)
+_memory_store_lock = threading.Lock()
+
+# --- HNSW Index Tuning ---
+HNSW_M = 24
+HNSW_EF_CONSTRUCTION = 128
+HNSW_EF_SEARCH = 100
+
+# --- Ingestion ---
+PRICE_COLUMNS = ["retail_price", "discounted_price"]
+TEXT_COLUMNS = [
+    "product_id",
+    "product_name",
+    "category",
+    "description",
+    "brand",
+    "product_url",
+    "image_url",
+]
+# Rows read from a Parquet file at a time; bounds ingestion memory.
+INGESTION_CHUNK_SIZE = 10_000
+# Bytes parsed from a CSV file at a time (pyarrow block size).
+INGESTION_CSV_BLOCK_SIZE = 8 * 1024 * 1024
+
+# --- Vector Store ---
+VECTOR_COLLECTION_NAME = "rag_products_collection"
+
+# --- Embeddings ---
+# text-embedding-004 returns 768-dimensional vectors.
+EMBEDDING_DIMENSIONS = 768
+EMBEDDING_COLUMN_TYPE = f"halfvec({EMBEDDING_DIMENSIONS})"
+# Vertex AI accepts at most 250 texts per embedding request.
+EMBEDDING_BATCH_SIZE = 250
+EMBEDDING_MAX_CONCURRENCY = 8
+# Batches rejected with 429 (quota exceeded) are retried with exponential
+# backoff and jitter before their documents are given up on.
+EMBEDDING_MAX_RETRIES = 4
+EMBEDDING_RETRY_BASE_DELAY_SECONDS = 2
+# Concurrent /chat queries are embedded together: up to 32 per request,
+# waiting at most 10 ms for a batch to fill.
+QUERY_EMBEDDING_BATCH_SIZE = 32
+QUERY_EMBEDDING_MAX_WAIT_SECONDS = 0.01
+
+# --- Retrieval ---
+# MMR picks k diverse products out of RETRIEVAL_FETCH_K_MULTIPLIER * k
+# candidates, so near-duplicate products don't crowd out the prompt.
+RETRIEVAL_FETCH_K_MULTIPLIER = 4
+RETRIEVAL_MMR_LAMBDA = 0.5
+# Character budget per document stuffed into the prompt. Documents lead with
+# name, brand, category and price, so only the description gets cut.
+RETRIEVED_DOCUMENT_MAX_CHARS = 400
+# Nearest MMR candidates for a query embedding, served by the HNSW index.
+VECTOR_SEARCH_QUERY = text(
+    f"""
+    SELECT e.id, e.document, e.cmetadata, e.embedding::text AS embedding
+    FROM langchain_pg_embedding e
+    JOIN langchain_pg_collection c ON c.uuid = e.collection_id
+    WHERE c.name = :collection_name
+    ORDER BY e.embedding <=> CAST(:embedding AS {EMBEDDING_COLUMN_TYPE})
+    LIMIT :limit
+    """
+)
+
+# --- Semantic Answer Cache ---
+# Cosine similarity required to serve a cached answer (distance < 0.03).
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.97
+# Cached answers older than this are ignored and pruned on the next insert.
+ANSWER_CACHE_TTL_SECONDS = 24 * 3600
+
+# --- Intent Classification ---
+# One pattern per chitchat intent, matching a whole normalized message made up
+# only of that intent's keywords and punctuation ("hello!", "hi, hey").
+CHITCHAT_INTENT_PATTERNS = {
+    intent: re.compile(
+        r"(?:{kw})(?:[\s,!.?]+(?:{kw}))*[\s!.?]*".format(
+            kw="|".join(map(re.escape, config["keywords"]))
+        )
+    )
+    for intent, config in CHITCHAT_RESPONSES.items()
+    if config.get("keywords")
+}
+# Pulls the label out of the LLM's {"intent": "..."} reply, even when it is
+# wrapped in code fences or surrounded by stray text.
+INTENT_JSON_PATTERN = re.compile(r'"intent"\s*:\s*"([a-z_]+)"')
+# Fallback: the outermost JSON object in the reply, without code fences.
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+
+# --- Prompt Templates ---
+INTENT_PROMPT = PromptTemplate.from_template(INTENT_CLASSIFICATION_PROMPT)
+CONTEXTUALIZE_Q_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", CONTEXTUALIZE_QUESTION_PROMPT),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ]
+)
+QA_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", PROMPT_TEMPLATE),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ]
+)
+
+# RAG chains are built lazily, once per retrieval size k.
+_chain_cache: dict[int, Runnable] = {}
+_qa_chain = None
+_intent_chain = None
+_ingestion_pool = None
+_is_ingestion_worker = False
+# LLM intent classifications, keyed by normalized question.
+_intent_cache = LRUCache(maxsize=10_000)
+_intent_cache_stats = Counter()
 
 
 def _get_db_engine():
@@ -63,10 +226,53 @@ def _get_db_engine():
         url = make_url(
             f"postgresql+psycopg2://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB_NAME}"
         )
-        db_engine = create_engine(url)
+        db_engine = create_engine(
+            url,
+            pool_size=PG_INGESTION_POOL_SIZE if _is_ingestion_worker else PG_POOL_SIZE,
+            max_overflow=(
+                PG_INGESTION_MAX_OVERFLOW if _is_ingestion_worker else PG_MAX_OVERFLOW
+            ),
+            pool_pre_ping=True,
+            pool_recycle=PG_POOL_RECYCLE_SECONDS,
+            pool_use_lifo=True,
+        )
+        event.listen(db_engine, "connect", _set_hnsw_ef_search)
+        event.listen(db_engine, "begin", _disable_bitmap_scan_for_vector_queries)
     return db_engine
 
 
+def _get_vector_engine():
+    """
+    Returns the shared engine flagged for vector similarity queries.
+    Transactions opened through it run with bitmap scans disabled.
+    """
+    return _get_db_engine().execution_options(vector_query=True)
+
+
+def _set_hnsw_ef_search(dbapi_connection, connection_record):
+    """
+    Sets the HNSW search breadth for every new database connection.
+    Runs in autocommit so the pool's rollback on checkin doesn't undo it.
+    """
+    existing_autocommit = dbapi_connection.autocommit
+    dbapi_connection.autocommit = True
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET hnsw.ef_search = {HNSW_EF_SEARCH}")
+    cursor.close()
+    dbapi_connection.autocommit = existing_autocommit
+
+
+def _disable_bitmap_scan_for_vector_queries(conn):
+    """
+    Keeps the planner on the HNSW index scan for vector queries: a bitmap
+    scan loses the distance ordering and has to re-check every candidate.
+    """
+    if conn.get_execution_options().get("vector_query"):
+        cursor = conn.connection.cursor()
+        cursor.execute("SET LOCAL enable_bitmapscan = off")
+        cursor.close()
+
+
 def setup_embeddings():
     """Initializes the Vertex AI embeddings model."""
     logger.info("⚙️ Initializing Vertex AI embeddings...")
@@ -75,9 +281,14 @@ def setup_embeddings():
     logger.info(f"📍 Embeddings config -> project: {project_id}, location: {location}")
     if not project_id:
         raise ValueError("GCP_PROJECT_ID environment variable is not set.")
-    return VertexAIEmbeddings(
+    embeddings = VertexAIEmbeddings(
         model_name="text-embedding-004", project=project_id, location=location
     )
+    client = _get_redis_client()
+    if client is not None:
+        logger.info("⚡ Caching embeddings in Redis.")
+        return CachedEmbeddings(embeddings, client)
+    return embeddings
 
 
 def initialize_vector_store():
@@ -85,9 +296,15 @@ def initialize_vector_store():
     Initializes the vector store, LLM, and database connection,
     and creates relational tables.
     """
-    global vector_store, embeddings_model, llm, SessionLocal
+    global vector_store, embeddings_model, query_embedder, llm, SessionLocal
+    global _qa_chain, _intent_chain
     if not embeddings_model:
         embeddings_model = setup_embeddings()
+        query_embedder = EmbeddingBatcher(
+            _embed_queries,
+            max_batch_size=QUERY_EMBEDDING_BATCH_SIZE,
+            max_wait=QUERY_EMBEDDING_MAX_WAIT_SECONDS,
+        )
 
     if not llm:
         logger.info("⚙️ Initializing Vertex AI LLM (Gemini)...")
@@ -98,246 +315,1036 @@ def initialize_vector_store():
         )
         logger.info("✅ LLM initialized.")
 
+    _chain_cache.clear()
+    _qa_chain = None
+    _intent_chain = INTENT_PROMPT | llm | StrOutputParser()
+
     engine = _get_db_engine()
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    SessionLocal = scoped_session(
+        sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    )
 
     logger.info("🔄 Ensuring relational tables exist...")
     Base.metadata.create_all(bind=engine)
     logger.info("✅ Relational tables created.")
 
-    collection_name = "rag_products_collection"
     logger.info(
-        f"🔄 Connecting to the vector database (Collection: {collection_name})..."
+        f"🔄 Connecting to the vector database (Collection: {VECTOR_COLLECTION_NAME})..."
     )
+    _ensure_vector_extension(engine)
     vector_store = PGVector(
         embeddings=embeddings_model,
-        collection_name=collection_name,
-        connection=engine,
+        collection_name=VECTOR_COLLECTION_NAME,
+        connection=_get_vector_engine(),
+        embedding_length=EMBEDDING_DIMENSIONS,
+        distance_strategy=DistanceStrategy.COSINE,
         use_jsonb=True,
+        create_extension=False,
     )
     logger.info("✅ Vector database connection established.")
 
-    with engine.connect() as conn:
-        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
-        conn.commit()
+    _ensure_hnsw_index(engine)
+    _ensure_answer_cache_table(engine)
+
+
+def _ensure_vector_extension(engine):
+    """
+    Creates the pgvector extension if it isn't installed yet. Checking the
+    catalog first avoids taking a DDL lock on every startup.
+    """
+    with engine.begin() as conn:
+        installed = conn.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'vector'")
+        ).scalar()
+        if not installed:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
     logger.info("✅ 'vector' (pg_vector) extension ensured.")
 
 
-def create_documents_from_db(products: list[Product]) -> list[Document]:
+def _ensure_hnsw_index(engine):
+    """
+    Creates the HNSW cosine index on the LangChain embedding table so
+    similarity searches don't fall back to a sequential scan.
+    """
+    logger.info("🔄 Ensuring HNSW index on the embedding table...")
+    with engine.begin() as conn:
+        # Embeddings are stored as half-precision vectors: half the disk and
+        # buffer-pool footprint, so more of the HNSW graph stays in memory.
+        column_type = conn.execute(
+            text(
+                "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+                "WHERE attrelid = 'langchain_pg_embedding'::regclass "
+                "AND attname = 'embedding'"
+            )
+        ).scalar()
+        if column_type != EMBEDDING_COLUMN_TYPE:
+            logger.info(f"🔄 Converting embedding column to {EMBEDDING_COLUMN_TYPE}...")
+            conn.execute(text("DROP INDEX IF EXISTS idx_langchain_pg_embedding_hnsw"))
+            conn.execute(
+                text(
+                    "ALTER TABLE langchain_pg_embedding ALTER COLUMN embedding "
+                    f"TYPE {EMBEDDING_COLUMN_TYPE} "
+                    f"USING embedding::{EMBEDDING_COLUMN_TYPE}"
+                )
+            )
+        conn.execute(
+            text(f"SET LOCAL maintenance_work_mem = '{PG_MAINTENANCE_WORK_MEM}'")
+        )
+        conn.execute(
+            text(
+                "SET LOCAL max_parallel_maintenance_workers = "
+                f"{PG_MAX_PARALLEL_MAINTENANCE_WORKERS}"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS idx_langchain_pg_embedding_hnsw "
+                "ON langchain_pg_embedding USING hnsw (embedding halfvec_cosine_ops) "
+                f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+            )
+        )
+    logger.info("✅ HNSW index ensured.")
+
+
+def _ensure_answer_cache_table(engine):
     """
-    Creates LangChain Document objects from a list of Product records.
+    Creates the table backing the semantic answer cache and its HNSW index.
     """
-    documents = []
-    for product in products:
-        price = "N/A"
-        if product.variants:
-            # Here we could add logic to show a price range if there are multiple variants
-            price = str(product.variants[0].retail_price or "N/A")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"""
+                CREATE TABLE IF NOT EXISTS rag_answer_cache (
+                    id BIGSERIAL PRIMARY KEY,
+                    k INTEGER NOT NULL,
+                    q_emb vector({EMBEDDING_DIMENSIONS}) NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    prompt TEXT,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """
+            )
+        )
+        # Tables created before the prompt was cached lack the column.
+        conn.execute(
+            text("ALTER TABLE rag_answer_cache ADD COLUMN IF NOT EXISTS prompt TEXT")
+        )
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS idx_rag_answer_cache_q_emb_hnsw "
+                "ON rag_answer_cache USING hnsw (q_emb vector_cosine_ops)"
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS idx_rag_answer_cache_created_at "
+                "ON rag_answer_cache (created_at)"
+            )
+        )
+    logger.info("✅ Semantic answer cache table ensured.")
 
-        # IMPORTANT: Add the price to the page_content so the LLM can see it.
-        page_content = f"Product: {product.name}. Brand: {product.brand}. Category: {product.category_tree}. Price: ${price}. Description: {product.description}"
 
-        metadata = {
-            "product_id": product.id,
-            "name": product.name,
-            "brand": product.brand,
-            "price": price,
-            "url": product.product_url,
-            "image_url": product.image_urls[0] if product.image_urls else "#",
+def _to_pgvector(embedding: list[float]) -> str:
+    """Serializes an embedding into pgvector's text representation."""
+    return "[" + ",".join(map(str, embedding)) + "]"
+
+
+def _lookup_cached_answer(
+    question_embedding: list[float], k: int
+) -> tuple[str, str | None] | None:
+    """
+    Returns the cached (answer, debug prompt) of the most similar previous
+    question, if its cosine similarity reaches ANSWER_CACHE_SIMILARITY_THRESHOLD
+    and it is younger than ANSWER_CACHE_TTL_SECONDS.
+    """
+    with _get_vector_engine().begin() as conn:
+        row = conn.execute(
+            text(
+                """
+                SELECT answer, prompt FROM rag_answer_cache
+                WHERE k = :k
+                  AND (q_emb <=> CAST(:q_emb AS vector)) < :max_distance
+                  AND created_at > now() - make_interval(secs => :ttl)
+                ORDER BY q_emb <=> CAST(:q_emb AS vector)
+                LIMIT 1
+                """
+            ),
+            {
+                "k": k,
+                "q_emb": _to_pgvector(question_embedding),
+                "max_distance": 1 - ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                "ttl": ANSWER_CACHE_TTL_SECONDS,
+            },
+        ).first()
+    return tuple(row) if row else None
+
+
+def _store_cached_answer(
+    question_embedding: list[float], k: int, question: str, answer: str, prompt: str
+):
+    """
+    Stores a freshly generated answer in the semantic answer cache and prunes
+    expired answers, so the table doesn't grow between ingestions.
+    """
+    with _get_db_engine().begin() as conn:
+        conn.execute(
+            text(
+                "DELETE FROM rag_answer_cache "
+                "WHERE created_at <= now() - make_interval(secs => :ttl)"
+            ),
+            {"ttl": ANSWER_CACHE_TTL_SECONDS},
+        )
+        conn.execute(
+            text(
+                """
+                INSERT INTO rag_answer_cache (k, q_emb, question, answer, prompt)
+                VALUES (:k, CAST(:q_emb AS vector), :question, :answer, :prompt)
+                """
+            ),
+            {
+                "k": k,
+                "q_emb": _to_pgvector(question_embedding),
+                "question": question,
+                "answer": answer,
+                "prompt": prompt,
+            },
+        )
+
+
+def create_documents_from_db(
+    products_with_price: list[tuple[Product, float | None]],
+) -> list[Document]:
+    """
+    Creates LangChain Document objects from (Product, minimum retail price) rows.
+    """
+    products = [product for product, _ in products_with_price]
+    df = pd.DataFrame(
+        {
+            "product_id": [product.id for product in products],
+            "name": [product.name for product in products],
+            "brand": [product.brand for product in products],
+            "category_tree": [product.category_tree for product in products],
+            "description": [product.description for product in products],
+            "price": [str(min_price or "N/A") for _, min_price in products_with_price],
+            "url": [product.product_url for product in products],
+            "image_url": [
+                product.image_urls[0] if product.image_urls else "#"
+                for product in products
+            ],
         }
-        documents.append(Document(page_content=page_content, metadata=metadata))
+    )
+
+    # IMPORTANT: Add the price to the page_content so the LLM can see it.
+    page_contents = (
+        "Product: "
+        + df["name"].astype(str)
+        + ". Brand: "
+        + df["brand"].astype(str)
+        + ". Category: "
+        + df["category_tree"].astype(str)
+        + ". Price: $"
+        + df["price"]
+        + ". Description: "
+        + df["description"].astype(str)
+    ).to_numpy()
+    metadatas = df[
+        ["product_id", "name", "brand", "price", "url", "image_url"]
+    ].to_dict("records")
+
+    # The fields are already plain str/dict, so pydantic validation is skipped.
+    documents = [
+        Document.model_construct(page_content=page_content, metadata=metadata)
+        for page_content, metadata in zip(page_contents, metadatas)
+    ]
     logger.info(f"✅ Created {len(documents)} documents from the database.")
     return documents
 
 
-def ingest_data_in_background(csv_path: str):
+async def embed_all(documents: list[Document]) -> list[list[float] | None]:
     """
-    Orchestrates the data ingestion pipeline from a structured CSV.
+    Embeds the documents' content in concurrent batches.
+    Documents of a batch that failed get None instead of an embedding.
     """
-    if not embeddings_model or not SessionLocal:
-        logger.error("Service not initialized. Cannot ingest data.")
-        return
+    texts = [doc.page_content for doc in documents]
+    batches = [
+        texts[i : i + EMBEDDING_BATCH_SIZE]
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)
+    ]
+    semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENCY)
 
-    logger.info(f"⏳ Starting ingestion process for clean file: {csv_path}")
-    try:
-        df = pd.read_csv(csv_path).astype(str)
-    except FileNotFoundError:
-        logger.error(f"❌ ERROR: File not found at '{csv_path}'.")
+    async def embed_batch(batch: list[str]) -> list[list[float]]:
+        async with semaphore:
+            for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+                try:
+                    return await embeddings_model.aembed_documents(batch)
+                except ResourceExhausted:
+                    if attempt == EMBEDDING_MAX_RETRIES:
+                        raise
+                    delay = EMBEDDING_RETRY_BASE_DELAY_SECONDS * 2**attempt
+                    delay += random.uniform(0, delay)
+                    logger.warning(
+                        f"⚠️ Embedding quota exceeded, retrying batch in {delay:.1f}s..."
+                    )
+                    await asyncio.sleep(delay)
+
+    results = await asyncio.gather(
+        *(embed_batch(batch) for batch in batches), return_exceptions=True
+    )
+
+    embeddings = []
+    for batch, result in zip(batches, results):
+        if isinstance(result, BaseException):
+            logger.error(f"❌ Failed to embed a batch of {len(batch)} texts: {result}")
+            embeddings.extend([None] * len(batch))
+        else:
+            embeddings.extend(result)
+    return embeddings
+
+
+def _prepare_products_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalizes a chunk of the clean products CSV: numeric prices and text
+    everywhere else.
+    """
+    for column in PRICE_COLUMNS:
+        if column in df:
+            df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0.0)
+        else:
+            df[column] = 0.0
+    text_columns = df.columns.difference(PRICE_COLUMNS)
+    df[text_columns] = df[text_columns].fillna("").astype(str)
+    return df
+
+
+def _read_product_chunks(path: str) -> Iterator[pd.DataFrame]:
+    """
+    Reads the columns ingestion uses from a products file, in chunks.
+    Parquet files are read in batches of INGESTION_CHUNK_SIZE rows; anything
+    else is streamed as CSV by pyarrow, as text without type inference.
+    """
+    if Path(path).suffix.lower() == ".parquet":
+        parquet_file = pq.ParquetFile(path)
+        available_columns = set(parquet_file.schema_arrow.names)
+        columns = [
+            column
+            for column in TEXT_COLUMNS + PRICE_COLUMNS
+            if column in available_columns
+        ]
+        for batch in parquet_file.iter_batches(
+            batch_size=INGESTION_CHUNK_SIZE, columns=columns
+        ):
+            yield batch.to_pandas()
         return
 
+    reader = pcsv.open_csv(
+        path,
+        read_options=pcsv.ReadOptions(block_size=INGESTION_CSV_BLOCK_SIZE),
+        # Descriptions may contain quoted line breaks.
+        parse_options=pcsv.ParseOptions(newlines_in_values=True),
+        convert_options=pcsv.ConvertOptions(
+            include_columns=TEXT_COLUMNS + PRICE_COLUMNS,
+            include_missing_columns=True,
+            # Prices are read as text too, so malformed values get coerced
+            # to 0.0 by _prepare_products_chunk instead of failing the file.
+            column_types={
+                column: pa.string() for column in TEXT_COLUMNS + PRICE_COLUMNS
+            },
+        ),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def _iter_products_file(path: str) -> Iterator[pd.DataFrame]:
+    """
+    Yields normalized chunks of a clean products file. The rows of the last
+    product in a chunk are held back and prepended to the next one, so the
+    contiguous rows of a product stay in one chunk. Rows of a product that
+    reappear further down an unsorted file land in a later chunk.
+    """
+    carry = None
+    for chunk in _read_product_chunks(path):
+        if chunk.empty:
+            continue
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        is_last_product = chunk["product_id"] == chunk["product_id"].iloc[-1]
+        carry = chunk[is_last_product]
+        if not is_last_product.all():
+            yield _prepare_products_chunk(chunk[~is_last_product].copy())
+    if carry is not None and not carry.empty:
+        yield _prepare_products_chunk(carry.copy())
+
+
+def _insert_new_products(df: pd.DataFrame, created_ids: dict[str, int]) -> list[int]:
+    """
+    Inserts the products in a chunk that aren't in the database yet, with
+    their variants. `created_ids` maps the uniq_id of every product created
+    earlier in the same ingestion to its id; rows of those products (from an
+    unsorted file) only add variants. It is updated once the chunk commits.
+    Returns the ids of the products that got new variants.
+    """
     session = SessionLocal()
     try:
-        grouped = df.groupby("product_id")
-        new_products = []
+        csv_product_ids = [
+            product_id
+            for product_id in df["product_id"].unique().tolist()
+            if product_id not in created_ids
+        ]
+        existing_ids = set(
+            session.execute(
+                select(Product.uniq_id).where(Product.uniq_id.in_(csv_product_ids))
+            ).scalars()
+        )
+        if existing_ids:
+            logger.info(f"Skipping {len(existing_ids)} existing products.")
+
+        new_rows = df[~df["product_id"].isin(existing_ids)]
+        # Products created by an earlier chunk only get their image URLs and
+        # variants added.
+        is_created = new_rows["product_id"].isin(list(created_ids))
+        extra_images = (
+            new_rows[is_created]
+            .groupby("product_id", sort=False)["image_url"]
+            .agg(list)
+        )
+        if not extra_images.empty:
+            created_products = session.execute(
+                select(Product).where(
+                    Product.id.in_(
+                        [created_ids[uniq_id] for uniq_id in extra_images.index]
+                    )
+                )
+            ).scalars()
+            for product in created_products:
+                urls = extra_images[product.uniq_id]
+                product.image_urls = (product.image_urls or []) + urls
 
-        for product_id, group in grouped:
-            existing_product = (
-                session.query(Product).filter_by(uniq_id=product_id).first()
+        grouped = new_rows[~is_created].groupby("product_id", sort=False)
+        first_rows = grouped[
+            ["product_name", "category", "description", "brand", "product_url"]
+        ].first()
+        image_urls = grouped["image_url"].agg(list)
+
+        new_products = [
+            Product(
+                uniq_id=uniq_id,
+                name=name,
+                category_tree=category,
+                description=description,
+                brand=brand,
+                product_url=product_url,
+                image_urls=urls,
             )
-            if existing_product:
-                logger.info(f"Skipping existing product: {product_id}")
-                continue
-
-            first_row = group.iloc[0]
-            product = Product(
-                uniq_id=product_id,
-                name=first_row["product_name"],
-                category_tree=first_row["category"],
-                description=first_row["description"],
-                brand=first_row["brand"],
-                product_url=first_row["product_url"],
-                image_urls=group["image_url"].tolist(),
+            for uniq_id, name, category, description, brand, product_url, urls in zip(
+                first_rows.index,
+                first_rows["product_name"].to_numpy(),
+                first_rows["category"].to_numpy(),
+                first_rows["description"].to_numpy(),
+                first_rows["brand"].to_numpy(),
+                first_rows["product_url"].to_numpy(),
+                image_urls.to_numpy(),
             )
-            session.add(product)
-            session.flush()
-
-            for _, row in group.iterrows():
-                variant = ProductVariant(
-                    product_id=product.id,
-                    retail_price=float(row.get("retail_price", 0.0)),
-                    discounted_price=float(row.get("discounted_price", 0.0)),
-                    stock=100,
-                )
-                session.add(variant)
-            new_products.append(product)
+        ]
+        # A single flush inserts every product and fetches their ids.
+        session.add_all(new_products)
+        session.flush()
+
+        id_by_uniq_id = dict(created_ids)
+        id_by_uniq_id.update({product.uniq_id: product.id for product in new_products})
+        variant_mappings = [
+            {
+                "product_id": product_id,
+                "retail_price": retail_price,
+                "discounted_price": discounted_price,
+                "stock": 100,
+            }
+            for product_id, (retail_price, discounted_price) in zip(
+                new_rows["product_id"].map(id_by_uniq_id).tolist(),
+                new_rows[PRICE_COLUMNS].to_numpy(dtype="float64").tolist(),
+            )
+        ]
 
+        session.bulk_insert_mappings(ProductVariant, variant_mappings)
         session.commit()
         logger.info(f"✅ Committed {len(new_products)} new products to the database.")
+        created_ids.update(id_by_uniq_id)
+        return new_rows["product_id"].map(id_by_uniq_id).unique().tolist()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        SessionLocal.remove()
 
-        if new_products:
-            product_ids = [p.id for p in new_products]
-            session.close()
 
-            session = SessionLocal()
-            hydrated_products = (
-                session.query(Product)
-                .options(joinedload(Product.variants))
-                .filter(Product.id.in_(product_ids))
-                .all()
+def _copy_embeddings_to_vector_store(embedded: list[tuple[Document, list[float]]]):
+    """
+    Bulk loads embedded documents into the vector store. Rows are streamed
+    with COPY into a staging table and upserted from there, keyed by
+    product id like PGVector.add_embeddings.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for doc, embedding in embedded:
+        writer.writerow(
+            [
+                str(doc.metadata["product_id"]),
+                _to_pgvector(embedding),
+                doc.page_content,
+                orjson.dumps(doc.metadata).decode(),
+            ]
+        )
+    buffer.seek(0)
+
+    connection = _get_db_engine().raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                CREATE TEMP TABLE staging_embeddings (
+                    id VARCHAR,
+                    embedding TEXT,
+                    document TEXT,
+                    cmetadata JSONB
+                ) ON COMMIT DROP
+                """
+            )
+            cursor.copy_expert(
+                "COPY staging_embeddings (id, embedding, document, cmetadata) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
             )
+            cursor.execute(
+                f"""
+                INSERT INTO langchain_pg_embedding
+                    (id, collection_id, embedding, document, cmetadata)
+                SELECT s.id, c.uuid, s.embedding::{EMBEDDING_COLUMN_TYPE},
+                       s.document, s.cmetadata
+                FROM staging_embeddings s
+                JOIN langchain_pg_collection c ON c.name = %s
+                ON CONFLICT (id) DO UPDATE SET
+                    collection_id = EXCLUDED.collection_id,
+                    embedding = EXCLUDED.embedding,
+                    document = EXCLUDED.document,
+                    cmetadata = EXCLUDED.cmetadata
+                """,
+                (VECTOR_COLLECTION_NAME,),
+            )
+        connection.commit()
+    finally:
+        connection.close()
 
-            documents = create_documents_from_db(hydrated_products)
-            if documents:
-                collection_name = "rag_products_collection"
-                logger.info(
-                    f"⏳ Ingesting {len(documents)} documents into vector store..."
-                )
-                PGVector.from_documents(
-                    embedding=embeddings_model,
-                    documents=documents,
-                    collection_name=collection_name,
-                    connection=_get_db_engine(),
-                    pre_delete_collection=True,
-                )
-                logger.info("✅ Vector store ingestion completed.")
 
+def _index_products(product_ids: list[int]):
+    """
+    Embeds the given products and adds them to the vector store.
+    """
+    session = SessionLocal()
+    try:
+        products_with_price = session.execute(
+            select(Product, func.min(ProductVariant.retail_price).label("min_price"))
+            .outerjoin(ProductVariant)
+            .where(Product.id.in_(product_ids))
+            .group_by(Product.id)
+        ).all()
+        documents = create_documents_from_db(products_with_price)
+    finally:
+        SessionLocal.remove()
+
+    if not documents:
+        return
+    logger.info(f"⏳ Ingesting {len(documents)} documents into vector store...")
+    embeddings = asyncio.run(embed_all(documents))
+    embedded = [
+        (doc, embedding)
+        for doc, embedding in zip(documents, embeddings)
+        if embedding is not None
+    ]
+    if embedded:
+        _copy_embeddings_to_vector_store(embedded)
+    logger.info(f"✅ Vector store ingestion completed ({len(embedded)} documents).")
+
+
+def _clear_answer_cache():
+    """
+    Empties the semantic answer cache. Newly ingested products can be better
+    matches than the ones cached answers were generated from.
+    """
+    with _get_db_engine().begin() as conn:
+        conn.execute(text("TRUNCATE rag_answer_cache"))
+    logger.info("🧹 Semantic answer cache cleared after ingestion.")
+
+
+def _analyze_ingested_tables():
+    """
+    Refreshes planner statistics after a bulk load, so vector searches and
+    product lookups are planned against the new row counts.
+    """
+    with _get_db_engine().begin() as conn:
+        conn.execute(
+            text(
+                "ANALYZE langchain_pg_embedding, "
+                f"{Product.__tablename__}, {ProductVariant.__tablename__}"
+            )
+        )
+    logger.info("✅ Table statistics refreshed.")
+
+
+def ingest_data_in_background(csv_path: str):
+    """
+    Orchestrates the data ingestion pipeline from a structured CSV or
+    Parquet file. The file is processed chunk by chunk: while one chunk is
+    embedded and indexed in a worker thread, the next one is parsed and
+    inserted.
+    """
+    if not embeddings_model or not vector_store or not SessionLocal:
+        logger.error("Service not initialized. Cannot ingest data.")
+        return
+
+    logger.info(f"⏳ Starting ingestion process for clean file: {csv_path}")
+    indexing = []
+    created_ids = {}
+    try:
+        with ThreadPoolExecutor(max_workers=1) as indexer:
+            for chunk in _iter_products_file(csv_path):
+                product_ids = _insert_new_products(chunk, created_ids)
+                if product_ids:
+                    indexing.append(indexer.submit(_index_products, product_ids))
+        for future in indexing:
+            future.result()
+        if indexing:
+            _analyze_ingested_tables()
+            _clear_answer_cache()
+    except FileNotFoundError:
+        logger.error(f"❌ ERROR: File not found at '{csv_path}'.")
     except Exception as e:
         logger.error(f"❌ An error occurred during data ingestion: {e}")
         import traceback
 
         logger.error(traceback.format_exc())
-        session.rollback()
-    finally:
-        session.close()
 
 
-def classify_intent(question: str) -> str:
+def _initialize_ingestion_worker():
+    """Initializes the service inside an ingestion process."""
+    global _is_ingestion_worker
+    _is_ingestion_worker = True
+    initialize_vector_store()
+
+
+def _get_ingestion_pool() -> ProcessPoolExecutor:
+    """
+    Creates and returns the process pool that runs ingestion, so parsing and
+    embedding never compete with /chat requests for the GIL.
+    Workers are spawned, not forked, and initialize their own clients: the
+    gRPC channels and connection pools of this process aren't fork-safe.
+    """
+    global _ingestion_pool
+    if _ingestion_pool is None:
+        _ingestion_pool = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialize_ingestion_worker,
+        )
+    return _ingestion_pool
+
+
+def submit_ingestion(file_path: str) -> Future:
+    """Schedules the ingestion of a products file in the ingestion process."""
+    global _ingestion_pool
+    try:
+        future = _get_ingestion_pool().submit(ingest_data_in_background, file_path)
+    except BrokenProcessPool:
+        logger.warning("⚠️ Ingestion process died, starting a new one...")
+        _ingestion_pool = None
+        future = _get_ingestion_pool().submit(ingest_data_in_background, file_path)
+
+    def log_failure(future: Future):
+        if not future.cancelled() and future.exception():
+            logger.error(f"❌ Ingestion process failed: {future.exception()}")
+
+    future.add_done_callback(log_failure)
+    return future
+
+
+def shutdown_ingestion_pool():
+    """Stops the ingestion process, letting a running ingestion finish."""
+    global _ingestion_pool
+    if _ingestion_pool is not None:
+        _ingestion_pool.shutdown(wait=True, cancel_futures=True)
+        _ingestion_pool = None
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases a question and collapses its whitespace."""
+    return " ".join(question.lower().split())
+
+
+def match_chitchat_intent(question: str) -> str | None:
+    """
+    Returns the chitchat intent whose keywords make up the whole question, or
+    None if it has any other content ("hi-fi headphones", "hey, any phones?").
+    """
+    question = normalize_question(question)
+    for intent, pattern in CHITCHAT_INTENT_PATTERNS.items():
+        if pattern.fullmatch(question):
+            return intent
+    return None
+
+
+async def _classify_intent_with_llm(question: str) -> str:
+    """
+    Asks the LLM for the intent of a normalized question, memoizing the answer.
+    Raises on unparseable output so that failures are never cached.
+    """
+    intent = _intent_cache.get(question)
+    _intent_cache_stats["hits" if intent is not None else "misses"] += 1
+    logger.info(
+        f"📊 Intent cache {'hit' if intent is not None else 'miss'} "
+        f"(hits={_intent_cache_stats['hits']}, misses={_intent_cache_stats['misses']})"
+    )
+    if intent is not None:
+        return intent
+
+    llm_output = await _intent_chain.ainvoke({"question": question})
+    match = INTENT_JSON_PATTERN.search(llm_output)
+    if match:
+        intent = match.group(1)
+    else:
+        try:
+            json_body = JSON_OBJECT_PATTERN.search(llm_output).group(0)
+            intent = orjson.loads(json_body).get("intent", "product_query")
+        except (orjson.JSONDecodeError, AttributeError) as e:
+            raise ValueError(
+                f"Error parsing intent JSON from LLM output: '{llm_output}'. Error: {e}."
+            ) from e
+    _intent_cache[question] = intent
+    return intent
+
+
+async def classify_intent(question: str) -> str:
     """
     Classifies the user's intent.
+    Messages made only of chitchat keywords are answered without the LLM; any
+    other message is classified (and its answer cached) by the LLM.
     """
+    intent = match_chitchat_intent(question)
+    if intent:
+        logger.info(f"⚡ Intent matched by keyword as: '{intent}'")
+        return intent
+
     if not llm:
         logger.warning("LLM not initialized, defaulting to product_query.")
         return "product_query"
 
     logger.info(f"🤖 Classifying intent for question: '{question}'")
-    prompt = PromptTemplate.from_template(INTENT_CLASSIFICATION_PROMPT)
-    chain = prompt | llm | StrOutputParser()
-
     try:
-        llm_output = chain.invoke({"question": question})
-        cleaned_output = (
-            llm_output.strip().replace("```json", "").replace("```", "").strip()
-        )
-        response_json = json.loads(cleaned_output)
-        intent = response_json.get("intent", "product_query")
+        intent = await _classify_intent_with_llm(normalize_question(question))
         logger.info(f"✅ Intent classified as: '{intent}'")
         return intent
-    except (json.JSONDecodeError, AttributeError) as e:
-        logger.error(
-            f"❌ Error parsing intent JSON from LLM output: '{llm_output}'. Error: {e}."
-        )
+    except ValueError as e:
+        logger.error(f"❌ {e}")
         return "product_query"
     except Exception as e:
         logger.error(f"❌ Unexpected error during intent classification: {e}.")
         return "product_query"
 
 
+def _get_redis_client():
+    """
+    Creates and returns the Redis client, if REDIS_URL is configured.
+    Caches the client (and its connection pool) for reuse.
+    """
+    global redis_client
+    if redis_client is None and REDIS_URL:
+        logger.info("📍 Creating Redis client...")
+        redis_client = Redis.from_url(REDIS_URL)
+    return redis_client
+
+
+def _create_memory(session_id: str) -> ConversationBufferWindowMemory:
+    memory_kwargs = {}
+    client = _get_redis_client()
+    if client:
+        memory_kwargs["chat_memory"] = RedisChatMessageHistory(
+            session_id=session_id,
+            client=client,
+            ttl=MEMORY_TTL_SECONDS,
+            max_messages=2 * MEMORY_WINDOW_TURNS,
+        )
+    return ConversationBufferWindowMemory(
+        k=MEMORY_WINDOW_TURNS,
+        memory_key="chat_history",
+        return_messages=True,
+        **memory_kwargs,
+    )
+
+
 def get_or_create_memory_for_session(session_id: str):
-    if session_id not in conversation_memory_store:
-        conversation_memory_store[session_id] = ConversationBufferWindowMemory(
-            k=10, memory_key="chat_history", return_messages=True
+    with _memory_store_lock:
+        memory = conversation_memory_store.get(session_id)
+        if memory is None:
+            memory = _create_memory(session_id)
+        # Re-inserting restarts the session's TTL on every access.
+        conversation_memory_store[session_id] = memory
+    return memory
+
+
+def delete_memory_for_session(session_id: str) -> bool:
+    """
+    Evicts a session's conversation memory. Returns False if there was none.
+    """
+    with _memory_store_lock:
+        existed = conversation_memory_store.pop(session_id, None) is not None
+
+    client = _get_redis_client()
+    if client:
+        history = RedisChatMessageHistory(session_id=session_id, client=client)
+        existed = history.exists() or existed
+        history.clear()
+    return existed
+
+
+def _trim_content(content: str) -> str:
+    """
+    Truncates a document's content to the per-document prompt budget,
+    cutting at a word boundary.
+    """
+    if len(content) <= RETRIEVED_DOCUMENT_MAX_CHARS:
+        return content
+    cut = content.rfind(" ", 0, RETRIEVED_DOCUMENT_MAX_CHARS)
+    if cut <= 0:
+        cut = RETRIEVED_DOCUMENT_MAX_CHARS
+    return content[:cut] + "..."
+
+
+def _embed_queries(queries: list[str]) -> list[list[float]]:
+    """
+    Embeds a batch of search queries. embed_documents would embed them with
+    the RETRIEVAL_DOCUMENT task type, so this goes through embed() instead.
+    """
+    return embeddings_model.embed(queries, embeddings_task_type="RETRIEVAL_QUERY")
+
+
+def _retrieve_documents_by_vector(embedding: list[float], k: int) -> list[Document]:
+    """
+    Returns k relevant and mutually diverse product documents for a query
+    embedding, trimmed to the prompt budget. The nearest candidates are
+    fetched with one raw SQL query, bypassing PGVector's ORM path, and
+    MMR picks k of them.
+    """
+    with _get_vector_engine().begin() as conn:
+        rows = conn.execute(
+            VECTOR_SEARCH_QUERY,
+            {
+                "collection_name": VECTOR_COLLECTION_NAME,
+                "embedding": _to_pgvector(embedding),
+                "limit": k * RETRIEVAL_FETCH_K_MULTIPLIER,
+            },
+        ).all()
+    if not rows:
+        return []
+
+    selected = maximal_marginal_relevance(
+        np.array(embedding, dtype=np.float32),
+        [orjson.loads(row.embedding) for row in rows],
+        lambda_mult=RETRIEVAL_MMR_LAMBDA,
+        k=k,
+    )
+    return [
+        Document.model_construct(
+            id=rows[i].id,
+            page_content=_trim_content(rows[i].document),
+            metadata=rows[i].cmetadata,
         )
-    return conversation_memory_store[session_id]
+        for i in selected
+    ]
+
+
+def retrieve_documents(
+    query: str, k: int, embedding: list[float] | None = None
+) -> list[Document]:
+    """
+    Returns the k product documents to answer the query with. A query
+    embedding computed earlier can be passed to skip embedding it again.
+    """
+    if embedding is None:
+        embedding = embeddings_model.embed_query(query)
+    return _retrieve_documents_by_vector(embedding, k)
+
+
+async def aretrieve_documents(
+    query: str, k: int, embedding: asyncio.Future | None = None
+) -> list[Document]:
+    """
+    Async variant of retrieve_documents. `embedding` may be a task already
+    embedding the query, shared with the answer cache lookup; otherwise the
+    query is embedded through the shared batcher. PGVector runs on a sync
+    engine, so the search itself runs in a worker thread.
+    """
+    if embedding is None:
+        query_embedding = await query_embedder.embed(query)
+    else:
+        # Shielded so that discarding this retrieval doesn't cancel the
+        # embedding for its other consumers.
+        query_embedding = await asyncio.shield(embedding)
+    return await asyncio.to_thread(_retrieve_documents_by_vector, query_embedding, k)
+
+
+def discard_task(task: asyncio.Task | None):
+    """Cancels a speculative task whose result is no longer needed."""
+    if task is None:
+        return
+    task.cancel()
+    # Retrieve the outcome so a task that already failed isn't reported as unhandled.
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+def _get_qa_chain() -> Runnable:
+    """Creates and returns the chain that answers from retrieved documents."""
+    global _qa_chain
+    if _qa_chain is None:
+        _qa_chain = create_stuff_documents_chain(llm, QA_PROMPT)
+    return _qa_chain
+
+
+def _build_chain(k: int) -> Runnable:
+    """
+    Builds the history-aware RAG chain for a given number of retrieved documents.
+    """
+
+    def retrieve(query: str) -> list[Document]:
+        return retrieve_documents(query, k)
+
+    async def aretrieve(query: str) -> list[Document]:
+        return await aretrieve_documents(query, k)
+
+    retriever = RunnableLambda(retrieve, afunc=aretrieve, name="retriever")
+
+    # 1. Create a history-aware retriever
+    history_aware_retriever = create_history_aware_retriever(
+        llm, retriever, CONTEXTUALIZE_Q_PROMPT
+    )
+
+    # 2. Create the final retrieval chain around the question-answering chain
+    return create_retrieval_chain(history_aware_retriever, _get_qa_chain())
 
 
-def get_rag_answer(session_id: str, question: str, k: int) -> dict:
+async def get_rag_answer(
+    session_id: str,
+    question: str,
+    k: int,
+    retrieval: asyncio.Task | None = None,
+    embedding: asyncio.Task | None = None,
+) -> dict:
     """
     Orchestrates the full RAG chain with history-aware retrieval.
+    `retrieval` may be a speculative task already retrieving documents for
+    the raw question; it is used when the question needs no contextualizing.
+    `embedding` may be the task embedding the raw question that `retrieval`
+    searches with, so the answer cache lookup reuses the same vector.
     """
     if not vector_store or not llm:
         logger.error("Vector store or LLM not initialized.")
+        discard_task(retrieval)
+        discard_task(embedding)
         return {
             "answer": "I'm sorry, but my knowledge base is currently unavailable.",
             "prompt": "Error: Not initialized.",
         }
 
     logger.info(f"🧠 Generating RAG answer for session '{session_id}'")
-    retriever = vector_store.as_retriever(search_kwargs={"k": k})
     memory = get_or_create_memory_for_session(session_id)
+    # The question embedding is only needed when there is no history, but
+    # starting it alongside the history load takes it off the critical path.
+    if embedding is None:
+        embedding = asyncio.create_task(query_embedder.embed(question))
+    try:
+        memory_variables = await asyncio.to_thread(memory.load_memory_variables, {})
+    except Exception:
+        discard_task(embedding)
+        raise
+    chat_history = memory_variables.get("chat_history", [])
 
-    # 1. Create a history-aware retriever
-    contextualize_q_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", CONTEXTUALIZE_QUESTION_PROMPT),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}"),
-        ]
-    )
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
-    )
-
-    # 2. Create the main chain to answer the question
-    qa_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", PROMPT_TEMPLATE),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}"),
-        ]
-    )
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
+    # Only standalone questions go through the semantic answer cache: once
+    # there is history, the answer also depends on the conversation.
+    question_embedding = None
+    if chat_history:
+        # The question gets contextualized first, so documents retrieved for
+        # the raw question can't be reused.
+        discard_task(retrieval)
+        discard_task(embedding)
+    else:
+        try:
+            question_embedding = await asyncio.shield(embedding)
+            cached_answer = await asyncio.to_thread(
+                _lookup_cached_answer, question_embedding, k
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Semantic answer cache lookup failed: {e}")
+            cached_answer = None
+        if cached_answer:
+            logger.info("⚡ Answer served from the semantic answer cache.")
+            discard_task(retrieval)
+            answer, prompt = cached_answer
+            await asyncio.to_thread(
+                memory.save_context, {"input": question}, {"output": answer}
+            )
+            return {
+                "answer": answer,
+                "prompt": prompt or "--- Served from the semantic answer cache ---",
+            }
 
-    # 3. Create the final retrieval chain
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    if chat_history:
+        rag_chain = _chain_cache.get(k)
+        if rag_chain is None:
+            rag_chain = _chain_cache.setdefault(k, _build_chain(k))
 
-    # 4. Invoke the chain with the current question and history
-    chat_history = memory.load_memory_variables({}).get("chat_history", [])
-    response = rag_chain.invoke({"input": question, "chat_history": chat_history})
+        # Invoke the chain with the current question and history
+        response = await rag_chain.ainvoke(
+            {"input": question, "chat_history": chat_history}
+        )
+    else:
+        # Without history the question is used as is, so the retrieved
+        # documents go straight to the question-answering chain.
+        if retrieval is None:
+            docs = await aretrieve_documents(question, k, embedding=embedding)
+        else:
+            docs = await retrieval
+        answer = await _get_qa_chain().ainvoke(
+            {"input": question, "chat_history": chat_history, "context": docs}
+        )
+        response = {"answer": answer, "context": docs, "chat_history": chat_history}
 
-    # 5. Save the new context to memory
-    memory.save_context({"input": question}, {"output": response["answer"]})
+    # Save the new context to memory
+    await asyncio.to_thread(
+        memory.save_context, {"input": question}, {"output": response["answer"]}
+    )
     logger.info(f"💾 Saved context to memory for session '{session_id}'.")
 
-    # 6. Format the debug prompt with history and context
+    # Format the debug prompt with history and context
     history_from_response = response.get("chat_history", [])
     formatted_history = "\n".join(
-        [f"{msg.__class__.__name__}: {msg.content}" for msg in history_from_response]
+        f"{msg.__class__.__name__}: {msg.content}" for msg in history_from_response
     )
-    retrieved_docs = "\n---\n".join([doc.page_content for doc in response["context"]])
+    retrieved_docs = "\n---\n".join(doc.page_content for doc in response["context"])
 
     debug_prompt = (
         f"--- Chat History Sent to Prompt ---\n{formatted_history}\n\n"
         f"--- Retrieved Context ---\n{retrieved_docs}"
     )
 
+    if question_embedding is not None:
+        try:
+            await asyncio.to_thread(
+                _store_cached_answer,
+                question_embedding,
+                k,
+                question,
+                response["answer"],
+                debug_prompt,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Could not store answer in the semantic cache: {e}")
+
     return {"answer": response["answer"], "prompt": debug_prompt}
@@ -79,6 +79,7 @@ async def lifespan(app: FastAPI):
     yield
 
     logger.info("=== APAGANDO APLICACIÓN ===")
+    rag_service.shutdown_ingestion_pool()
 
 
 # Crear app
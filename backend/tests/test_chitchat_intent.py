@@ -0,0 +1,34 @@
+import pytest
+
+from src.core.rag_service import match_chitchat_intent
+
+
+@pytest.mark.parametrize(
+    "question, intent",
+    [
+        ("hello", "greeting"),
+        ("Hello!", "greeting"),
+        ("hi, hey", "greeting"),
+        ("  Good   Morning ", "greeting"),
+        ("thank you!", "thanks"),
+        ("bye", "goodbye"),
+        ("who are you?", "identity"),
+    ],
+)
+def test_matches_messages_made_of_keywords(question, intent):
+    assert match_chitchat_intent(question) == intent
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "hi-fi headphones",
+        "show me hi-fi speakers",
+        "hey, any phones?",
+        "hi shoes under 50",
+        "hey phone",
+        "thinking",
+    ],
+)
+def test_ignores_messages_with_other_content(question):
+    assert match_chitchat_intent(question) is None